@@ -190,6 +190,24 @@ class QfcTestCase(APITransactionTestCase):
 
         self.fail("Worker didn't finish")
 
+    def wait_for_process_projectfile_job(self, project: Project) -> Job:
+        # Wait for the worker to finish
+        for _ in range(20):
+            time.sleep(3)
+            job = (
+                Job.objects.filter(
+                    project=project,
+                    type=Job.Type.PROCESS_PROJECTFILE,
+                )
+                .order_by("-created_at")
+                .first()
+            )
+
+            if job and job.status in (Job.Status.FINISHED, Job.Status.FAILED):
+                return job
+
+        self.fail("Worker didn't finish")
+
     def test_list_files_for_qfield(self):
         cur = self.conn.cursor()
         cur.execute(
@@ -545,6 +563,90 @@ class QfcTestCase(APITransactionTestCase):
 
         self.assertFalse(self.project1.has_online_vector_data)
 
+    def test_process_projectfile_qgz(self):
+        self.upload_files(
+            self.token1.key,
+            self.project1,
+            files=[
+                ("delta/nonspatial.csv", "nonspatial.csv"),
+                ("delta/testdata.gpkg", "testdata.gpkg"),
+                ("delta/points.geojson", "points.geojson"),
+                ("delta/polygons.geojson", "polygons.geojson"),
+                ("delta/project.qgz", "project.qgz"),
+            ],
+        )
+
+        job = self.wait_for_process_projectfile_job(self.project1)
+
+        self.assertEqual(job.status, Job.Status.FINISHED)
+
+    def test_process_projectfile_qgz_with_invalid_xml(self):
+        self.upload_files(
+            self.token1.key,
+            self.project1,
+            files=[
+                ("delta/project_invalid_xml.qgz", "project.qgz"),
+            ],
+        )
+
+        job = self.wait_for_process_projectfile_job(self.project1)
+
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertEqual(job.feedback["error_type"], "INVALID_PROJECT_FILE")
+
+    def test_process_projectfile_qgz_not_a_zip(self):
+        self.upload_files(
+            self.token1.key,
+            self.project1,
+            files=[
+                ("delta/not_a_zip.qgz", "project.qgz"),
+            ],
+        )
+
+        job = self.wait_for_process_projectfile_job(self.project1)
+
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertEqual(job.feedback["error_type"], "INVALID_PROJECT_FILE")
+
+    def test_process_projectfile_with_invalid_token(self):
+        self.upload_files(
+            self.token1.key,
+            self.project1,
+            files=[
+                ("delta/project_invalid_token.qgs", "project.qgs"),
+            ],
+        )
+
+        job = self.wait_for_process_projectfile_job(self.project1)
+
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertEqual(job.feedback["error_type"], "INVALID_PROJECT_FILE")
+        self.assertEqual(
+            job.feedback["error"],
+            "Project file is an invalid XML document:\n"
+            "Unable to parse character: 3. Replaced by '?' on line 13 that starts with: <description>WGS 84 Länge?",
+        )
+
+    def test_process_projectfile_with_invalid_token_after_first_chunk(self):
+        # the invalid token is past the first 128 KiB parsed chunk
+        self.upload_files(
+            self.token1.key,
+            self.project1,
+            files=[
+                ("delta/project_invalid_token_after_first_chunk.qgs", "project.qgs"),
+            ],
+        )
+
+        job = self.wait_for_process_projectfile_job(self.project1)
+
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertEqual(job.feedback["error_type"], "INVALID_PROJECT_FILE")
+        self.assertEqual(
+            job.feedback["error"],
+            "Project file is an invalid XML document:\n"
+            "Unable to parse character: 3. Replaced by '?' on line 2432 that starts with: <description>WGS 84 Länge?",
+        )
+
     def test_filename_with_whitespace(self):
         self.upload_files_and_check_package(
             token=self.token1.key,
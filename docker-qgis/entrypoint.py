@@ -13,6 +13,7 @@ from libqfieldsync.offliners import OfflinerType, PythonMiniOffliner, QgisCoreOf
 from libqfieldsync.project import ProjectConfiguration
 from libqfieldsync.utils.file_utils import get_project_in_folder
 from qfc_worker.utils import (
+    READ_ONLY_PROJECT_READ_FLAGS,
     Step,
     StepOutput,
     WorkDirPath,
@@ -145,19 +146,12 @@ def _extract_layer_data(project_filename: Union[str, Path]) -> dict:
 
 
 def _open_read_only_project(project_filename: str) -> QgsProject:
-    flags = (
-        # TODO we use `QgsProject` read flags, as the ones in `Qgis.ProjectReadFlags` do not work in QGIS 3.34.2
-        QgsProject.ReadFlags()
-        | QgsProject.ForceReadOnlyLayers
-        | QgsProject.FlagDontLoadLayouts
-        | QgsProject.FlagDontLoad3DViews
-        | QgsProject.DontLoadProjectStyles
-    )
     return open_qgis_project(
         project_filename,
         force_reload=True,
         disable_feature_count=True,
-        flags=flags,
+        flags=READ_ONLY_PROJECT_READ_FLAGS,
+        store_document=True,
     )
 
 
@@ -1,52 +1,103 @@
 import logging
+import mmap
+import zipfile
+import zlib
 from pathlib import Path
-from typing import Callable
-from xml.etree import ElementTree
+from xml.parsers import expat
 
 from qgis.core import (
-    QgsLayerTree,
     QgsMapRendererCustomPainterJob,
-    QgsMapSettings,
     QgsProject,
 )
 from qgis.PyQt.QtCore import QSize
-from qgis.PyQt.QtGui import QColor, QImage, QPainter
-from qgis.PyQt.QtXml import QDomDocument
+from qgis.PyQt.QtGui import QImage, QPainter
 
 from .utils import (
+    PROJECT_READ_FLAGS,
+    READ_ONLY_PROJECT_READ_FLAGS,
     FailedThumbnailGenerationException,
     InvalidFileExtensionException,
+    InvalidQgisFileException,
     InvalidXmlFileException,
     ProjectFileNotFoundException,
+    capture_project_document,
     get_layers_data,
+    get_map_canvas_settings,
     get_qgis_xml_error_context,
     layers_data_to_string,
 )
 
 logger = logging.getLogger("PROCPRJ")
 
+XML_PARSER_CHUNK_SIZE = 128 * 1024
+
+
+def _check_valid_xml(data: bytes | mmap.mmap, project_filename: Path) -> None:
+    # NOTE we only check if the XML is well-formed, so use `expat` directly and do not construct any elements
+    parser = expat.ParserCreate()
+    try:
+        with memoryview(data) as view:
+            for offset in range(0, len(view), XML_PARSER_CHUNK_SIZE):
+                parser.Parse(view[offset : offset + XML_PARSER_CHUNK_SIZE], False)
+
+        parser.Parse(b"", True)
+    except expat.ExpatError as error:
+        raise InvalidXmlFileException(
+            xml_error=get_qgis_xml_error_context(error, data, parser.ErrorByteIndex)
+            or str(error),
+            project_filename=project_filename,
+        )
+
 
 def check_valid_project_file(project_filename: Path) -> None:
     logger.info("Check QGIS project file validity…")
 
-    if not project_filename.exists():
-        raise ProjectFileNotFoundException(project_filename=project_filename)
-
-    if project_filename.suffix == ".qgs":
-        with open(project_filename, "rb") as fh:
+    suffix = project_filename.suffix
+
+    try:
+        if suffix == ".qgs":
+            with open(project_filename, "rb") as fh:
+                # NOTE map the file instead of reading it, so it is not copied into memory and the OS loads the pages on demand
+                try:
+                    data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # NOTE empty files cannot be memory mapped
+                    _check_valid_xml(b"", project_filename)
+                else:
+                    with data:
+                        _check_valid_xml(data, project_filename)
+        elif suffix == ".qgz":
             try:
-                for event, elem in ElementTree.iterparse(fh):
-                    continue
-            except ElementTree.ParseError as error:
-                error_msg = str(error)
-                raise InvalidXmlFileException(
-                    xml_error=get_qgis_xml_error_context(error_msg, fh) or error_msg,
-                    project_filename=project_filename,
+                with zipfile.ZipFile(project_filename) as archive:
+                    qgs_filename = next(
+                        (
+                            filename
+                            for filename in archive.namelist()
+                            if filename.lower().endswith(".qgs")
+                        ),
+                        None,
+                    )
+
+                    if qgs_filename is None:
+                        raise InvalidQgisFileException(
+                            project_filename=project_filename,
+                            error="The archive does not contain a .qgs file.",
+                        )
+
+                    qgs_data = archive.read(qgs_filename)
+            # NOTE corrupted deflate streams raise `zlib.error`, encrypted or unsupported entries raise `RuntimeError`
+            except (zipfile.BadZipFile, zlib.error, RuntimeError) as error:
+                raise InvalidQgisFileException(
+                    project_filename=project_filename, error=str(error)
                 )
-    elif project_filename.suffix != ".qgz":
-        raise InvalidFileExtensionException(
-            project_filename=project_filename, extension=project_filename.suffix
-        )
+
+            _check_valid_xml(qgs_data, project_filename)
+        else:
+            raise InvalidFileExtensionException(
+                project_filename=project_filename, extension=suffix
+            )
+    except FileNotFoundError:
+        raise ProjectFileNotFoundException(project_filename=project_filename)
 
     logger.info("QGIS project file is valid!")
 
@@ -57,55 +108,12 @@ def extract_project_details(project: QgsProject) -> dict[str, str]:
 
     details = {}
 
-    logger.info("Reading QGIS project file…")
-    map_settings = QgsMapSettings()
-
-    def on_project_read_wrapper(
-        tmp_project: QgsProject,
-    ) -> Callable[[QDomDocument], None]:
-        def on_project_read(doc: QDomDocument) -> None:
-            r, _success = tmp_project.readNumEntry("Gui", "/CanvasColorRedPart", 255)
-            g, _success = tmp_project.readNumEntry("Gui", "/CanvasColorGreenPart", 255)
-            b, _success = tmp_project.readNumEntry("Gui", "/CanvasColorBluePart", 255)
-            background_color = QColor(r, g, b)
-            map_settings.setBackgroundColor(background_color)
-
-            details["background_color"] = background_color.name()
-
-            nodes = doc.elementsByTagName("mapcanvas")
-
-            for i in range(nodes.size()):
-                node = nodes.item(i)
-                element = node.toElement()
-                if (
-                    element.hasAttribute("name")
-                    and element.attribute("name") == "theMapCanvas"
-                ):
-                    map_settings.readXml(node)
-
-            map_settings.setRotation(0)
-            map_settings.setOutputSize(QSize(1024, 768))
-
-            details["extent"] = map_settings.extent().asWktPolygon()
-
-        return on_project_read
-
-    # NOTE use a temporary project to get the project extent and background color
-    # as we can disable resolving layers, which results in great speed gains
-    tmp_project = QgsProject()
-    tmp_project_read_flags = (
-        # TODO we use `QgsProject` read flags, as the ones in `Qgis.ProjectReadFlags` do not work in QGIS 3.34.2
-        QgsProject.ReadFlags()
-        | QgsProject.FlagDontResolveLayers
-        | QgsProject.FlagDontLoadLayouts
-        | QgsProject.FlagDontLoad3DViews
-        | QgsProject.DontLoadProjectStyles
-    )
-    tmp_project.readProject.connect(on_project_read_wrapper(tmp_project))
-    tmp_project.read(project.fileName(), tmp_project_read_flags)
+    logger.info("Reading map canvas settings…")
+    map_settings = get_map_canvas_settings(project)
+    map_settings.setOutputSize(QSize(1024, 768))
 
-    # NOTE force delete the `QgsProject`, otherwise the `QgsApplication` might be deleted by the time the project is garbage collected
-    del tmp_project
+    details["background_color"] = map_settings.backgroundColor().name()
+    details["extent"] = map_settings.extent().asWktPolygon()
 
     details["crs"] = project.crs().authid()
     details["project_name"] = project.title()
@@ -113,7 +121,7 @@ def extract_project_details(project: QgsProject) -> dict[str, str]:
     logger.info("Extracting layer and datasource details…")
 
     details["layers_by_id"] = get_layers_data(project)
-    details["ordered_layer_ids"] = list(details["layers_by_id"].keys())
+    details["ordered_layer_ids"] = tuple(details["layers_by_id"])
     details["attachment_dirs"], _ = project.readListEntry(
         "QFieldSync", "attachmentDirs", ["DCIM"]
     )
@@ -136,61 +144,43 @@ def generate_thumbnail(project_filename: str, thumbnail_filename: Path) -> None:
     """
     logger.info("Generate project thumbnail image…")
 
-    map_settings = QgsMapSettings()
-
-    def on_project_read_wrapper(
-        tmp_project: QgsProject,
-        tmp_layer_tree: QgsLayerTree,
-    ) -> Callable[[QDomDocument], None]:
-        def on_project_read(doc: QDomDocument) -> None:
-            r, _success = tmp_project.readNumEntry("Gui", "/CanvasColorRedPart", 255)
-            g, _success = tmp_project.readNumEntry("Gui", "/CanvasColorGreenPart", 255)
-            b, _success = tmp_project.readNumEntry("Gui", "/CanvasColorBluePart", 255)
-            map_settings.setBackgroundColor(QColor(r, g, b))
-
-            nodes = doc.elementsByTagName("mapcanvas")
-
-            for i in range(nodes.size()):
-                node = nodes.item(i)
-                element = node.toElement()
-                if (
-                    element.hasAttribute("name")
-                    and element.attribute("name") == "theMapCanvas"
-                ):
-                    map_settings.readXml(node)
-
-            map_settings.setRotation(0)
-            map_settings.setTransformContext(tmp_project.transformContext())
-            map_settings.setPathResolver(tmp_project.pathResolver())
-            map_settings.setOutputSize(QSize(100, 100))
-            map_settings.setLayers(reversed(list(tmp_layer_tree.customLayerOrder())))
-
-        return on_project_read
-
-    # NOTE use a temporary project to generate the layer rendering with improved speed
-    tmp_project = QgsProject()
-    tmp_layer_tree = tmp_project.layerTreeRoot()
-    tmp_project_read_flags = (
-        # TODO we use `QgsProject` read flags, as the ones in `Qgis.ProjectReadFlags` do not work in QGIS 3.34.2
-        QgsProject.ReadFlags()
-        | QgsProject.ForceReadOnlyLayers
-        | QgsProject.FlagDontLoadLayouts
-        | QgsProject.FlagDontLoad3DViews
-        | QgsProject.DontLoadProjectStyles
-    )
-    tmp_project.readProject.connect(
-        on_project_read_wrapper(tmp_project, tmp_layer_tree)
-    )
-    tmp_project.read(
-        project_filename,
-        tmp_project_read_flags,
-    )
+    project = QgsProject.instance()
+    tmp_project = None
+    doc = None
+
+    # NOTE the project is usually already opened with `READ_ONLY_PROJECT_READ_FLAGS` by the opening check, so reuse it instead of reading it once again
+    is_opened_read_only = project.fileName() == project_filename and int(
+        PROJECT_READ_FLAGS.get(project_filename, 0)
+    ) == int(READ_ONLY_PROJECT_READ_FLAGS)
+
+    if not is_opened_read_only:
+        # NOTE use a temporary project to generate the layer rendering with improved speed
+        tmp_project = QgsProject()
+
+        # NOTE keep the document read by the temporary project, so the map canvas settings do not read the project file again
+        with capture_project_document(tmp_project) as documents:
+            tmp_project.read(
+                project_filename,
+                READ_ONLY_PROJECT_READ_FLAGS,
+            )
+
+        if documents:
+            doc = documents[-1]
+
+        project = tmp_project
+
+    map_settings = get_map_canvas_settings(project, doc)
+    map_settings.setTransformContext(project.transformContext())
+    map_settings.setPathResolver(project.pathResolver())
+    map_settings.setOutputSize(QSize(100, 100))
+    map_settings.setLayers(project.layerTreeRoot().customLayerOrder()[::-1])
 
     img = QImage(map_settings.outputSize(), QImage.Format_ARGB32)
     painter = QPainter(img)
     job = QgsMapRendererCustomPainterJob(map_settings, painter)
     # NOTE we use `renderSynchronously` as it does not crash and produces the thumbnail.
     # `waitForFinishedWithEventLoop` hangs forever and `waitForFinished` produces blank thumbnail, so don't use them!
+    # NOTE do not switch to `QgsMapRendererParallelJob`, for a 100x100 thumbnail the thread pool setup costs more than the rendering itself.
     job.renderSynchronously()
 
     if not img.save(str(thumbnail_filename)):
@@ -203,6 +193,7 @@ def generate_thumbnail(project_filename: str, thumbnail_filename: Path) -> None:
     del painter
     del img
     # NOTE force delete the `QgsProject`, otherwise the `QgsApplication` might be deleted by the time the project is garbage collected
+    del project
     del tmp_project
 
     logger.info("Project thumbnail image generated!")
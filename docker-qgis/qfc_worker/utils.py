@@ -5,6 +5,7 @@ import inspect
 import io
 import json
 import logging
+import mmap
 import os
 import re
 import socket
@@ -14,10 +15,11 @@ import tempfile
 import traceback
 import uuid
 import xml.etree.ElementTree as ET
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 from pathlib import Path
-from typing import IO, Any, Callable, NamedTuple, Optional
+from typing import IO, Any, Callable, Iterator, Optional
+from xml.parsers import expat
 
 from libqfieldsync.layer import LayerSource
 from libqfieldsync.utils.bad_layer_handler import (
@@ -35,7 +37,7 @@ from qgis.core import (
     QgsProviderRegistry,
     QgsZipUtils,
 )
-from qgis.PyQt import QtCore, QtGui
+from qgis.PyQt import QtCore, QtGui, QtXml
 from tabulate import tabulate
 
 # Get environment variables
@@ -145,6 +147,22 @@ def _write_log_message(message, tag, level):
 
 QGISAPP: QgsApplication = None
 
+# TODO we use `QgsProject` read flags, as the ones in `Qgis.ProjectReadFlags` do not work in QGIS 3.34.2
+# read flags to skip the project parts the worker never uses
+LIGHT_PROJECT_READ_FLAGS = (
+    QgsProject.ReadFlags()
+    | QgsProject.FlagDontLoadLayouts
+    | QgsProject.FlagDontLoad3DViews
+    | QgsProject.DontLoadProjectStyles
+)
+# read flags to open projects with read-only layers, e.g. for project checks and thumbnails
+READ_ONLY_PROJECT_READ_FLAGS = LIGHT_PROJECT_READ_FLAGS | QgsProject.ForceReadOnlyLayers
+
+# XML documents of the projects opened with `open_qgis_project(..., store_document=True)`, by project filename
+PROJECT_DOCUMENTS: dict[str, QtXml.QDomDocument] = {}
+# read flags of the projects opened with `open_qgis_project`, by project filename
+PROJECT_READ_FLAGS: dict[str, Qgis.ProjectReadFlags] = {}
+
 
 def start_app():
     """
@@ -206,6 +224,8 @@ def stop_app():
         return
 
     QgsProject.instance().clear()
+    PROJECT_DOCUMENTS.clear()
+    PROJECT_READ_FLAGS.clear()
 
     if QGISAPP is not None:
         logging.info("Stopping QGIS app…")
@@ -225,6 +245,7 @@ def open_qgis_project(
     force_reload: bool = False,
     disable_feature_count: bool = False,
     flags: Qgis.ProjectReadFlags = Qgis.ProjectReadFlags(),
+    store_document: bool = False,
 ) -> QgsProject:
     logging.info(f'Loading QGIS project "{project_filename}"…')
 
@@ -242,7 +263,14 @@ def open_qgis_project(
     if disable_feature_count:
         strip_feature_count_from_project_xml(project_filename)
 
-    with set_bad_layer_handler(project):
+    # NOTE drop the document and read flags stored by a previous read, as they might be outdated
+    PROJECT_DOCUMENTS.pop(str(project_filename), None)
+    PROJECT_READ_FLAGS.pop(str(project_filename), None)
+
+    with (
+        set_bad_layer_handler(project),
+        store_project_document(project) if store_document else nullcontext(),
+    ):
         if not project.read(str(project_filename), flags):
             logging.error(f'Failed to load QGIS project "{project_filename}"!')
 
@@ -250,6 +278,8 @@ def open_qgis_project(
 
             raise Exception(f"Unable to open project with QGIS: {project_filename}")
 
+    PROJECT_READ_FLAGS[str(project_filename)] = flags
+
     logging.info("Project loaded.")
 
     return project
@@ -583,38 +613,111 @@ def get_layer_filename(layer: QgsMapLayer) -> Optional[str]:
     return None
 
 
-def extract_project_details(project: QgsProject) -> dict[str, str]:
-    """Extract project details"""
+@contextmanager
+def capture_project_document(project: QgsProject) -> Iterator[list[QtXml.QDomDocument]]:
+    """Capture copies of the XML documents read by the project in the yielded list."""
+    documents: list[QtXml.QDomDocument] = []
+
+    def on_project_read(doc: QtXml.QDomDocument) -> None:
+        # NOTE copy the document, as the one passed to the signal is destroyed once the project is read
+        documents.append(QtXml.QDomDocument(doc))
+
+    project.readProject.connect(on_project_read)
+
+    try:
+        yield documents
+    finally:
+        project.readProject.disconnect(on_project_read)
+
+
+@contextmanager
+def store_project_document(project: QgsProject):
+    """Store the XML document read by the project, so it can be reused with `get_project_document`."""
+    with capture_project_document(project) as documents:
+        yield
+
+    if documents:
+        PROJECT_DOCUMENTS[project.fileName()] = documents[-1]
+
+
+def get_project_document(project: QgsProject) -> QtXml.QDomDocument:
+    """Get the XML document of the project.
+
+    The document stored when the project was opened with `open_qgis_project(..., store_document=True)` is reused,
+    otherwise the project file is read again with a temporary project without resolving the layers.
+    """
+    project_filename = project.fileName()
+
+    if project_filename in PROJECT_DOCUMENTS:
+        return PROJECT_DOCUMENTS[project_filename]
+
+    tmp_project = QgsProject()
+    tmp_project_read_flags = LIGHT_PROJECT_READ_FLAGS | QgsProject.FlagDontResolveLayers
+
+    with capture_project_document(tmp_project) as documents:
+        if not tmp_project.read(project_filename, tmp_project_read_flags):
+            raise Exception(f"Unable to read project with QGIS: {project_filename}")
+
+    # NOTE force delete the `QgsProject`, otherwise the `QgsApplication` might be deleted by the time the project is garbage collected
+    del tmp_project
+
+    return documents[-1]
+
+
+def get_map_canvas_element(doc: QtXml.QDomDocument) -> QtXml.QDomElement:
+    """Get the main map canvas element of the project document, or a null element if there is none."""
+    # NOTE `mapcanvas` elements are direct children of the document element, so there is no need to search the whole document
+    element = doc.documentElement().firstChildElement("mapcanvas")
+
+    while not element.isNull() and element.attribute("name") != "theMapCanvas":
+        element = element.nextSiblingElement("mapcanvas")
+
+    return element
+
+
+def read_canvas_color(project: QgsProject) -> QtGui.QColor:
+    """Read the map canvas background color stored in the project"""
+    r, _success = project.readNumEntry("Gui", "/CanvasColorRedPart", 255)
+    g, _success = project.readNumEntry("Gui", "/CanvasColorGreenPart", 255)
+    b, _success = project.readNumEntry("Gui", "/CanvasColorBluePart", 255)
+
+    return QtGui.QColor(r, g, b)
+
+
+def get_map_canvas_settings(
+    project: QgsProject, doc: Optional[QtXml.QDomDocument] = None
+) -> QgsMapSettings:
+    """Get the map settings of the main map canvas stored in the project, with no rotation
+
+    Args:
+        project (QgsProject)
+        doc (Optional[QtXml.QDomDocument]): the XML document the project was read from. If not given, it is retrieved with `get_project_document`.
+    """
     map_settings = QgsMapSettings()
-    details = {}
+    map_settings.setBackgroundColor(read_canvas_color(project))
 
-    def on_project_read(doc):
-        r, _success = project.readNumEntry("Gui", "/CanvasColorRedPart", 255)
-        g, _success = project.readNumEntry("Gui", "/CanvasColorGreenPart", 255)
-        b, _success = project.readNumEntry("Gui", "/CanvasColorBluePart", 255)
-        background_color = QtGui.QColor(r, g, b)
-        map_settings.setBackgroundColor(background_color)
+    if doc is None:
+        # NOTE reuse the XML document the project was opened from, instead of reading the project file again
+        doc = get_project_document(project)
 
-        details["background_color"] = background_color.name()
+    map_canvas_element = get_map_canvas_element(doc)
+    if not map_canvas_element.isNull():
+        map_settings.readXml(map_canvas_element)
 
-        nodes = doc.elementsByTagName("mapcanvas")
+    map_settings.setRotation(0)
 
-        for i in range(nodes.size()):
-            node = nodes.item(i)
-            element = node.toElement()
-            if (
-                element.hasAttribute("name")
-                and element.attribute("name") == "theMapCanvas"
-            ):
-                map_settings.readXml(node)
+    return map_settings
 
-        map_settings.setRotation(0)
-        map_settings.setOutputSize(QtCore.QSize(1024, 768))
 
-        details["extent"] = map_settings.extent().asWktPolygon()
+def extract_project_details(project: QgsProject) -> dict[str, str]:
+    """Extract project details"""
+    details = {}
 
-    project.readProject.connect(on_project_read)
-    project.read(project.fileName())
+    map_settings = get_map_canvas_settings(project)
+    map_settings.setOutputSize(QtCore.QSize(1024, 768))
+
+    details["background_color"] = map_settings.backgroundColor().name()
+    details["extent"] = map_settings.extent().asWktPolygon()
 
     details["crs"] = project.crs().authid()
     details["project_name"] = project.title()
@@ -698,7 +801,7 @@ def run_workflow(
                 feedback["error_type"] = "API_OTHER"
         elif isinstance(err, FileNotFoundError):
             feedback["error_type"] = "FILE_NOT_FOUND"
-        elif isinstance(err, InvalidXmlFileException):
+        elif isinstance(err, (InvalidXmlFileException, InvalidQgisFileException)):
             feedback["error_type"] = "INVALID_PROJECT_FILE"
         else:
             feedback["error_type"] = "UNKNOWN"
@@ -968,40 +1071,17 @@ def setup_basic_logging_config():
         handler.setFormatter(formatter)
 
 
-class XmlErrorLocation(NamedTuple):
-    line: int
-    column: int
-
-
-def get_qgis_xml_error_location(
-    invalid_token_error_msg: str,
-) -> Optional[XmlErrorLocation]:
-    """Get column and line numbers from the provided error message."""
-    if "invalid token" not in invalid_token_error_msg.casefold():
-        return None
-
-    _, details = invalid_token_error_msg.split(":")
-    line, column = details.split(",")
-    _, line_number = line.strip().split(" ")
-    _, column_number = column.strip().split(" ")
-
-    return XmlErrorLocation(int(line_number), int(column_number))
-
-
 def get_qgis_xml_error_context(
-    invalid_token_error_msg: str, fh: io.BufferedReader
+    error: expat.ExpatError, data: bytes | mmap.mmap, byte_index: int
 ) -> Optional[str]:
     """Get a slice of the line where the exception occurred, with all faulty occurrences sanitized."""
-    location = get_qgis_xml_error_location(invalid_token_error_msg)
-    if location:
+    if error.code == expat.errors.codes[expat.errors.XML_ERROR_INVALID_TOKEN]:
         substitute = "?"
-        fh.seek(0)
-        for cursor_pos, line in enumerate(fh, start=1):
-            if location.line == cursor_pos:
-                faulty_char = line[location.column]
-                suffix_slice = line[: location.column - 1]
-                clean_safe_slice = suffix_slice.decode("utf-8").strip() + substitute
-
-                return f"Unable to parse character: {repr(faulty_char)}. Replaced by '{substitute}' on line {location.line} that starts with: {clean_safe_slice}"
+        line_start = data.rfind(b"\n", 0, byte_index) + 1
+        faulty_char = data[byte_index]
+        suffix_slice = data[line_start:byte_index]
+        clean_safe_slice = suffix_slice.decode("utf-8").strip() + substitute
+
+        return f"Unable to parse character: {repr(faulty_char)}. Replaced by '{substitute}' on line {error.lineno} that starts with: {clean_safe_slice}"
 
     return None